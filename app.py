@@ -14,17 +14,23 @@ Default admin: admin / admin123
 from __future__ import annotations
 from datetime import datetime, date, time, timedelta
 from decimal import Decimal, ROUND_HALF_UP
-from typing import Optional
-import os, secrets, io, csv
+from functools import cached_property, lru_cache
+from typing import NamedTuple, Optional
+import os, secrets, io, csv, calendar, hmac
+from time import monotonic
 
 from flask import (
-    Flask, render_template, request, redirect, url_for, flash, session, abort, send_file
+    Flask, Response, render_template, request, redirect, url_for, flash, session, abort,
+    jsonify, stream_with_context
 )
 from sqlalchemy import (
     create_engine, Column, Integer, String, Numeric, DateTime, ForeignKey,
-    CheckConstraint, func
+    CheckConstraint, Index, and_, bindparam, case, event, func, or_, select
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import (
+    declarative_base, relationship, sessionmaker, scoped_session, joinedload, selectinload
 )
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker, scoped_session
 from werkzeug.security import generate_password_hash, check_password_hash
 from jinja2 import DictLoader
 
@@ -34,19 +40,64 @@ from jinja2 import DictLoader
 app = Flask(__name__)
 app.secret_key = os.environ.get("APP_SECRET", "dev-secret-change-me")
 
-engine = create_engine("sqlite:///grocery.db", echo=False, future=True)
+# compiled-statement cache; the few dozen distinct statements here already fit in the
+# default 500, the larger size is only headroom
+engine = create_engine("sqlite:///grocery.db", echo=False, future=True, query_cache_size=1200)
+
+@event.listens_for(engine, "connect")
+def _sqlite_pragmas(dbapi_conn, _record):
+    # WAL lets dashboard/report reads run alongside checkout writes; NORMAL sync is
+    # still crash-safe in WAL mode and skips an fsync per commit
+    cur = dbapi_conn.cursor()
+    for pragma in ("journal_mode=WAL", "synchronous=NORMAL", "temp_store=MEMORY",
+                   "mmap_size=268435456", "cache_size=-65536"):
+        cur.execute("PRAGMA " + pragma)
+    cur.close()
+
 SessionLocal = scoped_session(sessionmaker(bind=engine, autoflush=False, autocommit=False))
 Base = declarative_base()
 
 TWOPLACES = Decimal("0.01")
+DEC_ZERO = Decimal("0.00")
+DEC_TWO = Decimal("2")
+DEC_HUNDRED = Decimal("100")
 def money(x) -> Decimal:
     if not isinstance(x, Decimal):
         x = Decimal(str(x))
     return x.quantize(TWOPLACES, rounding=ROUND_HALF_UP)
 
+def to_paise(x) -> int:
+    """Amount -> integer hundredths (rupees -> paise, percent -> basis points)."""
+    return int(money(x).scaleb(2))
+
+@lru_cache(maxsize=4096, typed=True)
+def catalogue_paise(x: Decimal) -> int:
+    """to_paise() for stored prices and rates, which repeat across lines and orders."""
+    return to_paise(x)
+
+def from_paise(v: int) -> Decimal:
+    return Decimal(v).scaleb(-2)
+
+def div_half_up(n: int, d: int) -> int:
+    """Integer n/d rounded like ROUND_HALF_UP (ties away from zero)."""
+    q, r = divmod(abs(n), d)
+    if 2 * r >= d:
+        q += 1
+    return q if n >= 0 else -q
+
 def today() -> date:
     return datetime.now().date()
 
+def day_bounds(d: date) -> tuple[datetime, datetime]:
+    """Half-open [start, end) range of a calendar day."""
+    start = datetime.combine(d, time.min)
+    return start, start + timedelta(days=1)
+
+def month_bounds(y: int, m: int) -> tuple[datetime, datetime]:
+    """Half-open [start, end) range of a calendar month."""
+    start = datetime(y, m, 1)
+    return start, start + timedelta(days=calendar.monthrange(y, m)[1])
+
 # ---------------------------------------------------------------------
 # Models (barcode + discount support)
 # ---------------------------------------------------------------------
@@ -68,12 +119,12 @@ class Product(Base):
     id = Column(Integer, primary_key=True)
     sku = Column(String(60), unique=True, nullable=False)
     barcode = Column(String(120), unique=True, nullable=True)   # new: barcode/EAN/UPCA
-    name = Column(String(200), nullable=False)
+    name = Column(String(200), nullable=False, index=True)  # products list is ordered by name
     category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
     category = relationship("Category")
     price = Column(Numeric(10,2), nullable=False)      # selling price
     cost_price = Column(Numeric(10,2), nullable=False) # purchase price
-    gst_rate = Column(Numeric(5,2), nullable=False, default=Decimal("0.00"))  # %
+    gst_rate = Column(Numeric(5,2), nullable=False, default=DEC_ZERO)  # %
     unit = Column(String(30), nullable=False, default="pcs")
     stock_qty = Column(Integer, nullable=False, default=0)
     __table_args__ = (
@@ -97,12 +148,41 @@ class Order(Base):
     customer = relationship("Customer")
     staff_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     staff = relationship("User")
-    subtotal = Column(Numeric(12,2), nullable=False, default=Decimal("0.00"))   # before order discount
-    order_discount = Column(Numeric(5,2), nullable=False, default=Decimal("0.00")) # % e.g. 5 for 5%
-    tax_total = Column(Numeric(12,2), nullable=False, default=Decimal("0.00"))
-    grand_total = Column(Numeric(12,2), nullable=False, default=Decimal("0.00"))
-    profit_amount = Column(Numeric(12,2), nullable=False, default=Decimal("0.00"))
-    items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
+    subtotal = Column(Numeric(12,2), nullable=False, default=DEC_ZERO)   # before order discount
+    order_discount = Column(Numeric(5,2), nullable=False, default=DEC_ZERO) # % e.g. 5 for 5%
+    tax_total = Column(Numeric(12,2), nullable=False, default=DEC_ZERO)
+    grand_total = Column(Numeric(12,2), nullable=False, default=DEC_ZERO)
+    profit_amount = Column(Numeric(12,2), nullable=False, default=DEC_ZERO)
+    items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan",
+                         order_by="OrderItem.id")
+    __table_args__ = (Index("ix_orders_created_at", "created_at"),)  # dashboard/report date ranges
+
+class LineTotals(NamedTuple):
+    subtotal: Decimal
+    discount: Decimal
+    taxable: Decimal
+    tax: Decimal
+    total: Decimal
+    profit: Decimal
+
+def line_totals_paise(up: int, qty: int, disc_bp: int, gst_bp: int, cp: int) -> tuple[int, ...]:
+    """(subtotal, discount, taxable, tax, total, profit) of one line, all in paise.
+
+    Prices are in paise and rates in basis points; each step rounds half-up
+    like money() so the printed columns always add up.
+    """
+    sub = up * qty
+    disc = div_half_up(sub * disc_bp, 10000)
+    taxable = sub - disc
+    tax = div_half_up(taxable * gst_bp, 10000)
+    # profit reduces by discount amount
+    profit = (up - cp) * qty - disc
+    return sub, disc, taxable, tax, taxable + tax, profit
+
+def line_totals(unit_price, qty: int, discount_pct, gst_rate, cost_price) -> LineTotals:
+    return LineTotals(*map(from_paise, line_totals_paise(
+        catalogue_paise(unit_price), qty, catalogue_paise(discount_pct),
+        catalogue_paise(gst_rate), catalogue_paise(cost_price))))
 
 class OrderItem(Base):
     __tablename__ = "order_items"
@@ -114,33 +194,17 @@ class OrderItem(Base):
     quantity = Column(Integer, nullable=False)
     unit_price = Column(Numeric(10,2), nullable=False)  # captured sale price
     gst_rate = Column(Numeric(5,2), nullable=False)
-    discount_pct = Column(Numeric(5,2), nullable=False, default=Decimal("0.00"))  # line discount %
-    __table_args__ = (CheckConstraint("quantity > 0"),)
+    discount_pct = Column(Numeric(5,2), nullable=False, default=DEC_ZERO)  # line discount %
+    __table_args__ = (
+        CheckConstraint("quantity > 0"),
+        Index("ix_order_items_order_product", "order_id", "product_id"),
+    )
 
     # computational helpers
-    def line_subtotal(self):
-        return money(Decimal(self.unit_price) * self.quantity)
-
-    def line_discount_amount(self):
-        return money(self.line_subtotal() * (Decimal(self.discount_pct)/Decimal("100")))
-
-    def line_taxable(self):
-        return money(self.line_subtotal() - self.line_discount_amount())
-
-    def line_tax(self):
-        rate = Decimal(self.gst_rate) / Decimal("100")
-        return money(self.line_taxable() * rate)
-
-    def line_total(self):
-        return money(self.line_taxable() + self.line_tax())
-
-    def line_profit(self):
-        # profit reduces by discount amount
-        cp = Decimal(self.product.cost_price)
-        sp = Decimal(self.unit_price)
-        base_profit = (sp - cp) * self.quantity
-        profit_after_discount = Decimal(base_profit) - self.line_discount_amount()
-        return money(profit_after_discount)
+    @cached_property
+    def totals(self) -> LineTotals:
+        return line_totals(self.unit_price, self.quantity, self.discount_pct,
+                           self.gst_rate, self.product.cost_price)
 
 class InventoryLog(Base):
     __tablename__ = "inventory_logs"
@@ -160,12 +224,32 @@ class InventoryLog(Base):
 def db():
     return SessionLocal()
 
+# pinned so hashes don't depend on the installed werkzeug's default (older releases use pbkdf2)
+PASSWORD_HASH_METHOD = "scrypt:32768:8:1"
+def hash_password(password: str) -> str:
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+
+# hash_password("admin123") computed once, so first boot doesn't pay for an scrypt run
+DEFAULT_ADMIN_HASH = (
+    "scrypt:32768:8:1$1xoBgrrp3ayL9TSU$"
+    "e50e51315a91b7013d330efadd04888e8c1ceada537cb8ac888a7bcc6b1b92b0"
+    "7671206c6583836037012f52f5bb3eafeb197057ff6a566fad8f9d06a0807365"
+)
+
 def init_db():
     Base.metadata.create_all(engine)
+    # create_all skips tables that already exist, so add any indexes an older grocery.db lacks
+    for table in Base.metadata.sorted_tables:
+        for ix in table.indexes:
+            ix.create(engine, checkfirst=True)
     s = db()
-    if not s.query(User).filter_by(username="admin").first():
-        u = User(username="admin", password_hash=generate_password_hash("admin123"), role="admin")
-        s.add(u)
+    # a single INSERT OR IGNORE both checks for and creates the default admin
+    seeded = s.execute(
+        sqlite_insert(User)
+        .values(username="admin", password_hash=DEFAULT_ADMIN_HASH, role="admin")
+        .on_conflict_do_nothing(index_elements=["username"])
+    ).rowcount
+    if seeded:
         # seed categories/products including barcode values
         c1 = Category(name="Food & Beverages")
         c2 = Category(name="Home Care")
@@ -178,7 +262,7 @@ def init_db():
             Product(sku="DETER1", barcode="8901000000034", name="Detergent 1kg", category_id=c2.id,
                     price=Decimal("120.00"), cost_price=Decimal("90.00"), gst_rate=Decimal("18.00"), unit="pack", stock_qty=30),
         ])
-        s.commit()
+    s.commit()
     s.close()
 
 # ---------------------------------------------------------------------
@@ -193,13 +277,14 @@ def get_csrf_token() -> str:
     return token
 
 def require_csrf():
-    form_token = request.form.get("csrf_token")
-    if not form_token or form_token != session.get(CSRF_SESSION_KEY):
+    expected = session.get(CSRF_SESSION_KEY)
+    form_token = request.form.get("csrf_token", "")
+    if not expected or not hmac.compare_digest(expected.encode(), form_token.encode()):
         abort(400, description="Invalid CSRF token")
 
-@app.context_processor
-def inject_csrf():
-    return {"csrf_token": get_csrf_token}
+# a plain Jinja global, looked up only by templates that print a token
+# (a context processor would run on every render)
+app.jinja_env.globals["csrf_token"] = get_csrf_token
 
 # ---------------------------------------------------------------------
 # Auth helpers
@@ -373,15 +458,17 @@ TEMPLATES = {
     <summary>Customer</summary>
     <div class="grid">
       <label>Phone <input name="phone" required></label>
-      <label>Name (only if new) <input name="name" placeholder="New customer"></label>
+      <label>Name (new customer, or to correct it) <input name="name" placeholder="New customer"></label>
     </div>
   </details>
 
   <details class="no-print" open>
     <summary>Add Item</summary>
     <div class="grid">
-      <label>Barcode / SKU <input name="barcode_or_sku" placeholder="Scan or type barcode or SKU"></label>
+      <label>Barcode / SKU <input name="barcode_or_sku" list="product-matches" autocomplete="off" placeholder="Scan barcode, or type SKU or name"></label>
+      <datalist id="product-matches"></datalist>
       <label>OR choose product
+        {% if products|length >= dropdown_limit %}<span class="muted">(first {{ dropdown_limit }} by name)</span>{% endif %}
         <select name="product_id">
           {% for p in products %}<option value="{{p.id}}">{{p.sku}} - {{p.name}} (Stock {{p.stock_qty}})</option>{% endfor %}
         </select>
@@ -404,32 +491,88 @@ TEMPLATES = {
   <p><button>Checkout</button></p>
 </form>
 
-{% if cart and cart|length>0 %}
+<section id="cart"{% if not cart %} hidden{% endif %}>
   <h3>Cart</h3>
   <table>
     <thead><tr><th>Item</th><th>Qty</th><th>Unit ₹</th><th>Line Disc%</th><th>GST%</th><th>Line Total ₹</th></tr></thead>
     <tbody>
       {% for c in cart %}
         <tr>
-          <td>{{ c.product.name }}</td>
+          <td>{{ c.name }}</td>
           <td>{{ c.qty }}</td>
-          <td>{{ '%.2f'|format(c.product.price) }}</td>
-          <td>{{ '%.2f'|format(c.discount or 0) }}</td>
-          <td>{{ '%.2f'|format(c.product.gst_rate) }}</td>
-          <td>
-            {% set ls = (c.product.price * c.qty) %}
-            {% set ld = ls * ((c.discount or 0)/100) %}
-            {% set ta = ls - ld %}
-            {% set tax = ta * (c.product.gst_rate/100) %}
-            ₹ {{ '%.2f'|format(ta + tax) }}
-          </td>
+          <td>{{ c.unit_price }}</td>
+          <td>{{ c.discount }}</td>
+          <td>{{ c.gst_rate }}</td>
+          <td>₹ {{ c.total }}</td>
         </tr>
       {% endfor %}
     </tbody>
+    <tfoot><tr><th colspan="5">Total</th><th>₹ <span id="cart-total">{{ cart_total }}</span></th></tr></tfoot>
   </table>
 
   <p class="muted">Apply order discount at checkout to reduce subtotal before taxes.</p>
-{% endif %}
+</section>
+<script>
+  // add items without a page reload; without JS the button posts the form to /pos as before
+  (function () {
+    var button = document.querySelector('button[name=add_line]');
+    var form = button.form;
+    var cart = document.getElementById('cart');
+    button.addEventListener('click', function (e) {
+      e.preventDefault();
+      var data = new FormData(form);
+      fetch('{{ url_for("pos_add_line") }}', {method: 'POST', body: data})
+        .then(function (r) { return r.json(); })
+        .then(function (res) {
+          var note = document.getElementById('add-line-msg');
+          if (!note) {
+            note = document.createElement('article');
+            note.id = 'add-line-msg';
+            note.className = 'no-print';
+            form.parentNode.insertBefore(note, form);
+          }
+          if (!res.ok) { note.className = 'no-print warning'; note.textContent = res.error; return; }
+          var l = res.line, tr = document.createElement('tr');
+          [l.name, l.qty, l.unit_price, l.discount, l.gst_rate, '₹ ' + l.total].forEach(function (v) {
+            var td = document.createElement('td');
+            td.textContent = v;
+            tr.appendChild(td);
+          });
+          cart.querySelector('tbody').appendChild(tr);
+          document.getElementById('cart-total').textContent = res.totals.total;
+          cart.hidden = false;
+          note.className = 'no-print success'; note.textContent = 'Item added';
+          form.elements.barcode_or_sku.value = '';
+          form.elements.barcode_or_sku.focus();
+        })
+        .catch(function () { form.requestSubmit(button); });  // not JSON (e.g. logged out): post normally
+    });
+  })();
+  // suggest matching products (by name, SKU or barcode) while typing in Barcode / SKU
+  (function () {
+    var input = document.querySelector('input[name=barcode_or_sku]');
+    var list = document.getElementById('product-matches');
+    var timer;
+    input.addEventListener('input', function () {
+      clearTimeout(timer);
+      var q = input.value.trim();
+      if (q.length < 2) { list.innerHTML = ''; return; }
+      timer = setTimeout(function () {
+        fetch('{{ url_for("products_search") }}?q=' + encodeURIComponent(q))
+          .then(function (r) { return r.json(); })
+          .then(function (rows) {
+            list.innerHTML = '';
+            rows.forEach(function (p) {
+              var o = document.createElement('option');
+              o.value = p.sku;
+              o.label = p.name + ' - ₹ ' + p.price + ' (Stock ' + p.stock_qty + ')';
+              list.appendChild(o);
+            });
+          });
+      }, 200);
+    });
+  })();
+</script>
 {% endblock %}
 """,
 "orders.html": """
@@ -456,6 +599,10 @@ TEMPLATES = {
     {% endfor %}
   </tbody>
 </table>
+<p class="no-print">
+  {% if paged %}<a href="{{ url_for('orders') }}">&larr; Newest</a>{% endif %}
+  {% if next_page %}<a href="{{ next_page }}" style="float:right">Older &rarr;</a>{% endif %}
+</p>
 {% endblock %}
 """,
 "invoice.html": """
@@ -475,18 +622,17 @@ TEMPLATES = {
   <table>
     <thead><tr><th>Item</th><th>Qty</th><th>Unit ₹</th><th>Disc%</th><th>Taxable ₹</th><th>Tax ₹ (CGST/SGST)</th><th>Total ₹</th></tr></thead>
     <tbody>
-      {% for it in o.items %}
+      {% for r in rows %}
       <tr>
-        <td>{{ it.product.name }}</td>
-        <td>{{ it.quantity }}</td>
-        <td>{{ '%.2f'|format(it.unit_price) }}</td>
-        <td>{{ '%.2f'|format(it.discount_pct) }}</td>
-        <td>{{ '%.2f'|format(it.line_taxable()) }}</td>
-        {% set tax = it.line_tax() %}
+        <td>{{ r.name }}</td>
+        <td>{{ r.qty }}</td>
+        <td>{{ r.unit_price }}</td>
+        <td>{{ r.discount }}</td>
+        <td>{{ r.taxable }}</td>
         <td>
-          CGST ₹ {{ '%.2f'|format((tax/2)) }} / SGST ₹ {{ '%.2f'|format((tax/2)) }}
+          CGST ₹ {{ r.half_tax }} / SGST ₹ {{ r.half_tax }}
         </td>
-        <td>{{ '%.2f'|format(it.line_total()) }}</td>
+        <td>{{ r.total }}</td>
       </tr>
       {% endfor %}
     </tbody>
@@ -529,11 +675,11 @@ TEMPLATES = {
   <table>
     <thead><tr><th>Item</th><th class="right">Qty</th><th class="right">Amt</th></tr></thead>
     <tbody>
-      {% for it in o.items %}
+      {% for r in rows %}
       <tr>
-        <td>{{ it.product.name|truncate(20) }}</td>
-        <td class="right">{{ it.quantity }}</td>
-        <td class="right">₹ {{ '%.2f'|format(it.line_total()) }}</td>
+        <td>{{ r.name|truncate(20) }}</td>
+        <td class="right">{{ r.qty }}</td>
+        <td class="right">₹ {{ r.total }}</td>
       </tr>
       {% endfor %}
     </tbody>
@@ -571,8 +717,41 @@ TEMPLATES = {
 </form>
 {% endblock %}
 """,
+"reports_monthly.html": """
+{% extends 'base.html' %}
+{% block title %}Monthly Report{% endblock %}
+{% block content %}
+<h2>Monthly Report: {{ month }}</h2>
+<table>
+  <tr><th>Subtotal</th><td>₹ {{ sub }}</td></tr>
+  <tr><th>Tax</th><td>₹ {{ tax }}</td></tr>
+  <tr><th>Grand Total</th><td>₹ {{ total }}</td></tr>
+  <tr><th>Profit</th><td>₹ {{ profit }}</td></tr>
+</table>
+{% if days %}
+<h3>By Day</h3>
+<table>
+  <thead><tr><th>Date</th><th>Orders</th><th>Subtotal ₹</th><th>Tax ₹</th><th>Grand Total ₹</th><th>Profit ₹</th></tr></thead>
+  <tbody>
+    {% for d in days %}
+      <tr>
+        <td><a href="{{ url_for('reports_daily', date=d.day) }}">{{ d.day }}</a></td>
+        <td>{{ d.orders }}</td><td>{{ d.sub }}</td><td>{{ d.tax }}</td><td>{{ d.total }}</td><td>{{ d.profit }}</td>
+      </tr>
+    {% endfor %}
+  </tbody>
+</table>
+{% endif %}
+<p class="no-print"><a href="{{ url_for('reports_daily') }}">Back</a></p>
+{% endblock %}
+""",
 }
 app.jinja_loader = DictLoader(TEMPLATES)
+# TEMPLATES never changes at runtime, so skip the per-render freshness check
+# (debug mode would otherwise enable it) and compile every template once at startup
+app.config["TEMPLATES_AUTO_RELOAD"] = False
+for _name in TEMPLATES:
+    app.jinja_env.get_template(_name)
 
 # ---------------------------------------------------------------------
 # Routes: Auth / Home
@@ -590,10 +769,15 @@ def login():
         username = request.form.get("username","").strip()
         password = request.form.get("password","")
         s = db()
-        user = s.query(User).filter_by(username=username).first()
+        user = s.scalar(select(User).where(User.username == username))
         if user and check_password_hash(user.password_hash, password):
+            if not user.password_hash.startswith(PASSWORD_HASH_METHOD + "$"):
+                # upgrade hashes created with an older method while we have the plain password
+                user.password_hash = hash_password(password)
+                s.commit()
             session["user_id"] = user.id
             session["role"] = user.role
+            session.pop(CSRF_SESSION_KEY, None)  # new token for the signed-in session
             flash("Welcome!", "success")
             return redirect(url_for("dashboard"))
         flash("Invalid credentials", "warning")
@@ -613,19 +797,17 @@ def dashboard():
     r = require_login()
     if r: return r
     s = db()
-    start = datetime.combine(today(), time.min)
-    end = datetime.combine(today(), time.max)
+    start, end = day_bounds(today())
     t_sales, t_profit = s.query(
         func.coalesce(func.sum(Order.grand_total), 0),
         func.coalesce(func.sum(Order.profit_amount), 0)
-    ).filter(Order.created_at.between(start, end)).first()
+    ).filter(Order.created_at >= start, Order.created_at < end).first()
     now = datetime.now()
-    m_start = datetime(now.year, now.month, 1)
-    m_end = datetime(now.year + (now.month==12), (now.month % 12) + 1, 1) - timedelta(seconds=1)
+    m_start, m_end = month_bounds(now.year, now.month)
     m_sales, m_profit = s.query(
         func.coalesce(func.sum(Order.grand_total), 0),
         func.coalesce(func.sum(Order.profit_amount), 0)
-    ).filter(Order.created_at.between(m_start, m_end)).first()
+    ).filter(Order.created_at >= m_start, Order.created_at < m_end).first()
     return render_template("dashboard.html",
         today_sales=f"{(t_sales or 0):.2f}", today_profit=f"{(t_profit or 0):.2f}",
         month_sales=f"{(m_sales or 0):.2f}", month_profit=f"{(m_profit or 0):.2f}"
@@ -664,6 +846,7 @@ def add_product():
             stock_qty=int(request.form.get("stock_qty",0))
         )
         s.add(p); s.commit()
+        invalidate_product_caches()
         flash("Product added", "success")
     except Exception as e:
         s.rollback()
@@ -686,23 +869,33 @@ def refill():
         p.stock_qty += qty
         s.add(InventoryLog(product=p, change_qty=qty, reason="refill", staff_id=session["user_id"], note="Refill"))
         s.commit()
+        invalidate_product_caches(stock_only=True)
         flash("Stock updated", "success")
     except Exception as e:
         s.rollback()
         flash(f"Refill failed: {e}", "warning")
     return redirect(url_for("products"))
 
+class _CsvLine:
+    """Write target for csv.writer: writerow() hands back the formatted line."""
+    def write(self, line):
+        return line
+
 @app.route("/products/export")
 def products_export():
     r = require_login("staff")
     if r: return r
     s = db()
-    buf = io.StringIO(); w = csv.writer(buf)
-    w.writerow(["sku","barcode","name","category","price","cost_price","gst_rate","unit","stock_qty"])
-    for p in s.query(Product).join(Category).all():
-        w.writerow([p.sku, p.barcode or "", p.name, p.category.name, f"{p.price:.2f}", f"{p.cost_price:.2f}", f"{p.gst_rate:.2f}", p.unit, p.stock_qty])
-    buf.seek(0)
-    return send_file(io.BytesIO(buf.read().encode("utf-8")), as_attachment=True, download_name="products.csv", mimetype="text/csv")
+    rows = (s.query(Product.sku, Product.barcode, Product.name, Category.name, Product.price,
+                    Product.cost_price, Product.gst_rate, Product.unit, Product.stock_qty)
+            .join(Category).yield_per(500))
+    def generate():
+        w = csv.writer(_CsvLine())
+        yield w.writerow(["sku","barcode","name","category","price","cost_price","gst_rate","unit","stock_qty"])
+        for sku, barcode, name, cname, price, cost_price, gst_rate, unit, stock_qty in rows:
+            yield w.writerow([sku, barcode or "", name, cname, f"{price:.2f}", f"{cost_price:.2f}", f"{gst_rate:.2f}", unit, stock_qty])
+    return Response(stream_with_context(generate()), mimetype="text/csv",
+                    headers={"Content-Disposition": "attachment; filename=products.csv"})
 
 @app.route("/products/import", methods=["POST"])
 def products_import():
@@ -713,178 +906,419 @@ def products_import():
     f = request.files.get("file")
     if not f:
         flash("No file uploaded", "warning"); return redirect(url_for("products"))
-    created = 0
-    reader = csv.DictReader(io.StringIO(f.read().decode("utf-8")))
-    for row in reader:
+    # two SELECTs up front instead of two per row; products are merged as plain
+    # dicts and written with one bulk insert and one bulk update
+    cats = dict(s.execute(select(Category.name, Category.id)).all())
+    cols = (Product.id, Product.sku, Product.barcode, Product.name, Product.price,
+            Product.cost_price, Product.gst_rate, Product.unit, Product.stock_qty)
+    known = {row.sku: dict(row._mapping) for row in s.execute(select(*cols))}
+    to_insert, to_update = {}, {}
+    rows = list(csv.DictReader(io.StringIO(f.read().decode("utf-8"))))
+    # new categories in file order, created by one INSERT ... RETURNING instead of a flush each
+    new_cats = [c for c in dict.fromkeys((row.get("category") or "General").strip() for row in rows)
+                if c not in cats]
+    if new_cats:
+        cats.update(s.execute(Category.__table__.insert().values([{"name": c} for c in new_cats])
+                              .returning(Category.name, Category.id)).all())
+    for row in rows:
         cname = (row.get("category") or "General").strip()
-        cat = s.query(Category).filter_by(name=cname).first()
-        if not cat:
-            cat = Category(name=cname); s.add(cat); s.flush()
         sku = (row.get("sku") or "").strip()
         if not sku: continue
-        existing = s.query(Product).filter_by(sku=sku).first()
+        existing = known.get(sku)
         if existing:
-            existing.barcode = (row.get("barcode") or existing.barcode)
-            existing.name = row.get("name") or existing.name
-            existing.category_id = cat.id
-            existing.price = money(row.get("price") or existing.price)
-            existing.cost_price = money(row.get("cost_price") or existing.cost_price)
-            existing.gst_rate = money(row.get("gst_rate") or existing.gst_rate)
-            existing.unit = row.get("unit") or existing.unit
-            existing.stock_qty = int(row.get("stock_qty") or existing.stock_qty)
+            existing.update(
+                barcode=(row.get("barcode") or existing["barcode"]),
+                name=row.get("name") or existing["name"],
+                category_id=cats[cname],
+                price=money(row.get("price") or existing["price"]),
+                cost_price=money(row.get("cost_price") or existing["cost_price"]),
+                gst_rate=money(row.get("gst_rate") or existing["gst_rate"]),
+                unit=row.get("unit") or existing["unit"],
+                stock_qty=int(row.get("stock_qty") or existing["stock_qty"]),
+            )
+            if "id" in existing:  # rows repeated in the same file stay in to_insert
+                to_update[sku] = existing
         else:
-            s.add(Product(
+            known[sku] = to_insert[sku] = dict(
                 sku=sku,
                 barcode=(row.get("barcode") or None),
                 name=row.get("name") or sku,
-                category_id=cat.id,
+                category_id=cats[cname],
                 price=money(row.get("price") or "0"),
                 cost_price=money(row.get("cost_price") or "0"),
                 gst_rate=money(row.get("gst_rate") or "0"),
                 unit=row.get("unit") or "pcs",
                 stock_qty=int(row.get("stock_qty") or 0)
-            ))
-            created += 1
+            )
+    if to_insert:
+        s.bulk_insert_mappings(Product, list(to_insert.values()))
+    if to_update:
+        s.bulk_update_mappings(Product, list(to_update.values()))
     s.commit()
+    invalidate_product_caches()
+    created = len(to_insert)
     flash(f"Imported/updated products (new: {created})", "success")
     return redirect(url_for("products"))
 
 # ---------------------------------------------------------------------
 # POS: barcode search, line discounts, order discount, checkout
 # ---------------------------------------------------------------------
+# process-local product caches, each stamped with the version it was built from:
+# the barcode/SKU -> id map follows _codes_version, the POS dropdown follows
+# _products_version (which also moves on every stock change)
+_codes_version = 0
+_products_version = 0
+_product_codes: tuple[int, dict[str, int]] = (-1, {})
+
+class ProductChoice(NamedTuple):
+    id: int
+    sku: str
+    name: str
+    stock_qty: int
+
+POS_DROPDOWN_LIMIT = 50
+# the version only tracks this process's writes; the TTL bounds how stale the stock figures
+# can get when other worker processes sell or refill
+POS_DROPDOWN_TTL = 30  # seconds
+_dropdown: tuple[int, float, list[ProductChoice]] = (-1, 0.0, [])
+
+def invalidate_product_caches(stock_only: bool = False):
+    """Call after committing product changes; stock_only when no SKU/barcode changed."""
+    global _codes_version, _products_version
+    _products_version += 1
+    if not stock_only:
+        _codes_version += 1
+
+def dropdown_products(s) -> list[ProductChoice]:
+    global _dropdown
+    version, built, rows = _dropdown
+    now = monotonic()
+    if version != _products_version or now - built > POS_DROPDOWN_TTL:
+        # stamp with the version seen before the SELECT: a write committed while it runs
+        # then leaves the cache stale-marked instead of passing for current
+        version = _products_version
+        rows = [ProductChoice(*r) for r in s.execute(
+            select(Product.id, Product.sku, Product.name, Product.stock_qty)
+            .order_by(Product.name).limit(POS_DROPDOWN_LIMIT))]
+        _dropdown = (version, now, rows)
+    return rows
+
+def products_by_id(s, ids, for_update: bool = False) -> dict[int, Product]:
+    """Load several products with one IN query.
+
+    for_update adds FOR UPDATE on servers that have it; SQLite ignores it and takes no
+    lock for a SELECT, so callers writing stock must still guard their UPDATE.
+    """
+    ids = set(ids)
+    if not ids:
+        return {}
+    q = s.query(Product).filter(Product.id.in_(ids))
+    if for_update:
+        q = q.with_for_update()
+    return {p.id: p for p in q}
+
+def cart_lines() -> list[list[int]]:
+    """Session cart as compact [product_id, qty, discount_bp] lists (discount in basis points)."""
+    lines = []
+    for line in session.get("cart", []):
+        if isinstance(line, dict):  # carts saved before the compact format
+            line = [int(line["product_id"]), int(line["qty"]), to_paise(line.get("discount", 0))]
+        lines.append(line)
+    return lines
+
+# hot-path lookup, built once at import instead of on every scan
+_PRODUCT_BY_CODE = (select(Product)
+                    .where(or_(Product.barcode == bindparam("code"), Product.sku == bindparam("code")))
+                    .limit(1))
+
+def lookup_product(s, code: str) -> Optional[Product]:
+    global _product_codes
+    version, ids = _product_codes
+    if version != _codes_version:
+        version = _codes_version  # read before the scan, as in dropdown_products()
+        ids = {}
+        for pid, sku, barcode in s.execute(select(Product.id, Product.sku, Product.barcode)):
+            ids[sku] = pid
+            if barcode:
+                ids[barcode] = pid
+        _product_codes = (version, ids)
+    pid = ids.get(code)
+    prod = s.get(Product, pid) if pid is not None else None
+    if prod is None or code not in (prod.barcode, prod.sku):
+        # not cached, or changed by another worker process: ask the database
+        prod = s.scalars(_PRODUCT_BY_CODE, {"code": code}).first()
+        if prod:
+            ids[code] = prod.id
+    return prod
+
+@app.route("/api/products/search")
+def products_search():
+    r = require_login("staff")
+    if r: return r
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify([])
+    s = db()
+    # match the typed text literally: escape LIKE's own wildcards
+    pattern = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    rows = (s.query(Product)
+            .filter(Product.name.ilike(f"%{pattern}%", escape="\\") | (Product.sku == q) | (Product.barcode == q))
+            .order_by(Product.name).limit(20).all())
+    return jsonify([{"id": p.id, "name": p.name, "sku": p.sku, "barcode": p.barcode,
+                     "price": f"{p.price:.2f}", "stock_qty": p.stock_qty} for p in rows])
+
+def add_cart_line(s, cart: list[list[int]]) -> tuple[Optional[Product], Optional[str]]:
+    """Validate the add-item form and append the line to the session cart.
+
+    Returns (product, None) on success or (None, warning message).
+    """
+    barcode_or_sku = (request.form.get("barcode_or_sku") or "").strip()
+    if barcode_or_sku:
+        prod = lookup_product(s, barcode_or_sku)
+        if not prod:
+            return None, "Product not found by barcode/SKU"
+    else:
+        prod = s.get(Product, int(request.form.get("product_id")))
+    qty = int(request.form.get("qty", 1))
+    line_discount = Decimal(request.form.get("line_discount") or "0")
+    if not prod:
+        return None, "Product not found"
+    if qty <= 0:
+        return None, "Invalid quantity"
+    if prod.stock_qty < qty:
+        return None, f"Not enough stock for {prod.name}"
+    cart.append([prod.id, qty, to_paise(line_discount)])
+    session["cart"] = cart
+    return prod, None
+
+def cart_view_line(prod: Product, qty: int, disc_bp: int) -> dict:
+    """One cart row as shown on the POS page; money is preformatted like InvoiceRow."""
+    total = line_totals_paise(catalogue_paise(prod.price), qty, disc_bp,
+                              catalogue_paise(prod.gst_rate), catalogue_paise(prod.cost_price))[4]
+    return {"name": prod.name, "qty": qty, "unit_price": f"{prod.price:.2f}",
+            "discount": f"{from_paise(disc_bp):.2f}", "gst_rate": f"{prod.gst_rate:.2f}",
+            "total": f"{from_paise(total):.2f}", "total_paise": total}
+
+def cart_view_lines(s, cart: list[list[int]]) -> list[dict]:
+    prods = products_by_id(s, (pid for pid, _, _ in cart))
+    return [cart_view_line(prods[pid], qty, disc_bp) for pid, qty, disc_bp in cart if pid in prods]
+
+@app.route("/api/pos/add_line", methods=["POST"])
+def pos_add_line():
+    """Add a scanned item without reloading the POS page; answers with the new row and cart total."""
+    r = require_login("staff")
+    if r: return r
+    require_csrf()
+    s = db()
+    cart = cart_lines()
+    prod, error = add_cart_line(s, cart)
+    if error:
+        return jsonify(ok=False, error=error), 400
+    _, qty, disc_bp = cart[-1]
+    line = cart_view_line(prod, qty, disc_bp)
+    del line["total_paise"]
+    cart_total = sum(l["total_paise"] for l in cart_view_lines(s, cart))
+    return jsonify(ok=True, line=line,
+                   totals={"lines": len(cart), "total": f"{from_paise(cart_total):.2f}"})
+
 @app.route("/pos", methods=["GET","POST"])
 def pos():
     r = require_login("staff")
     if r: return r
     s = db()
-    products = s.query(Product).order_by(Product.name).all()
-    cart = session.get("cart", [])
+    cart = cart_lines()
     order_discount = session.get("order_discount", 0)
 
     if request.method == "POST":
         require_csrf()
-        # Add by barcode/SKU
+        # Add by barcode/SKU (pages with JS post to /api/pos/add_line instead)
         if "add_line" in request.form:
-            barcode_or_sku = (request.form.get("barcode_or_sku") or "").strip()
-            pid = None
-            prod = None
-            if barcode_or_sku:
-                prod = s.query(Product).filter((Product.barcode==barcode_or_sku)|(Product.sku==barcode_or_sku)).first()
-                if not prod:
-                    flash("Product not found by barcode/SKU", "warning")
-                    return redirect(url_for("pos"))
-                pid = prod.id
-            else:
-                pid = int(request.form.get("product_id"))
-                prod = s.get(Product, pid)
-            qty = int(request.form.get("qty", 1))
-            line_discount = Decimal(request.form.get("line_discount") or "0")
-            if not prod:
-                flash("Product not found", "warning"); return redirect(url_for("pos"))
-            if qty <= 0:
-                flash("Invalid quantity", "warning"); return redirect(url_for("pos"))
-            if prod.stock_qty < qty:
-                flash(f"Not enough stock for {prod.name}", "warning"); return redirect(url_for("pos"))
-            cart.append({"product_id": pid, "qty": qty, "discount": float(line_discount)})
-            session["cart"] = cart
-            flash("Item added", "success")
+            prod, error = add_cart_line(s, cart)
+            flash(error or "Item added", "warning" if error else "success")
             return redirect(url_for("pos"))
 
         # Checkout
         phone = (request.form.get("phone") or "").strip()
-        name = (request.form.get("name") or "").strip() or "Customer"
+        name = (request.form.get("name") or "").strip()
         order_discount_val = Decimal(request.form.get("order_discount") or "0")
         if not cart:
             flash("Cart is empty", "warning"); return redirect(url_for("pos"))
-        cust = s.query(Customer).filter_by(phone=phone).first()
-        if not cust:
-            cust = Customer(name=name, phone=phone); s.add(cust); s.flush()
-
-        order = Order(customer=cust, staff_id=session["user_id"], order_discount=order_discount_val)
-        s.add(order); s.flush()
-        subtotal = Decimal("0.00")
-        tax_total = Decimal("0.00")
-        profit_total = Decimal("0.00")
-
-        for line in cart:
-            prod = s.get(Product, int(line["product_id"]))
-            qty = int(line["qty"])
+
+        # check stock for the whole cart before anything is written; the stock UPDATE
+        # below re-checks it, since another register may sell the same items meanwhile
+        needed = {}  # product_id -> qty across all lines
+        for pid, qty, _ in cart:
+            needed[pid] = needed.get(pid, 0) + qty
+        prods = products_by_id(s, needed, for_update=True)
+        for pid, qty in needed.items():
+            prod = prods.get(pid)
+            if not prod:
+                s.rollback(); flash("Product in cart no longer exists", "warning"); return redirect(url_for("pos"))
             if prod.stock_qty < qty:
                 s.rollback(); flash(f"Stock changed for {prod.name}", "warning"); return redirect(url_for("pos"))
-            item = OrderItem(order=order, product=prod, quantity=qty,
-                             unit_price=prod.price, gst_rate=prod.gst_rate,
-                             discount_pct=Decimal(str(line.get("discount", 0))))
-            s.add(item)
-            # update stock & log
-            prod.stock_qty -= qty
-            s.add(InventoryLog(product=prod, change_qty=-qty, reason="sale", staff_id=session["user_id"], note=f"Order #{order.id}"))
-            # totals per line use new helpers
-            subtotal += item.line_taxable()
-            tax_total += item.line_tax()
-            profit_total += item.line_profit()
+
+        # take the stock first: one UPDATE ... CASE id WHEN ... for every product in the cart,
+        # only where enough is still left. It is the first write, so on SQLite it also takes
+        # the write lock for the rest of the checkout
+        products_t = Product.__table__
+        sold = case(needed, value=products_t.c.id)
+        taken = s.execute(
+            products_t.update()
+            .where(products_t.c.id.in_(needed), products_t.c.stock_qty >= sold)
+            .values(stock_qty=products_t.c.stock_qty - sold)
+        ).rowcount
+        if taken != len(needed):
+            s.rollback()
+            short = s.scalars(select(Product.name).where(
+                products_t.c.id.in_(needed), products_t.c.stock_qty < sold)).all()
+            flash(f"Stock changed for {', '.join(short) or 'an item in the cart'}", "warning")
+            return redirect(url_for("pos"))
+
+        # one upsert on the unique phone; a typed name renames an existing customer,
+        # a blank one leaves it alone (the no-op SET still lets RETURNING give the id)
+        ins = sqlite_insert(Customer.__table__).values(phone=phone, name=name or "Customer")
+        cust_id = s.execute(ins.on_conflict_do_update(
+            index_elements=["phone"],
+            set_={"name": ins.excluded.name} if name else {"phone": ins.excluded.phone},
+        ).returning(Customer.id)).scalar_one()
+
+        # price every line first, then write the order as a handful of Core statements
+        lines = []
+        subtotal = tax_total = profit_total = 0  # paise
+        for pid, qty, disc_bp in cart:
+            prod = prods[pid]
+            lines.append((prod, qty, from_paise(disc_bp)))
+            # one fused integer pass per line; the cart already carries the discount in basis points
+            _, _, taxable, tax, _, profit = line_totals_paise(
+                catalogue_paise(prod.price), qty, disc_bp,
+                catalogue_paise(prod.gst_rate), catalogue_paise(prod.cost_price))
+            subtotal += taxable
+            tax_total += tax
+            profit_total += profit
+        subtotal, tax_total, profit_total = map(from_paise, (subtotal, tax_total, profit_total))
 
         # apply order-level discount percentage on subtotal (reduces taxable base proportionally)
-        order.subtotal = money(subtotal)
-        if order.order_discount and order.order_discount > 0:
-            od_pct = Decimal(order.order_discount) / Decimal("100")
+        order_subtotal = money(subtotal)
+        if order_discount_val and order_discount_val > 0:
+            od_pct = order_discount_val / DEC_HUNDRED
             # discount amount on subtotal
-            order_discount_amount = money(order.subtotal * od_pct)
+            order_discount_amount = money(order_subtotal * od_pct)
             # reduce subtotal and proportionally reduce tax and profit
-            order.subtotal = money(order.subtotal - order_discount_amount)
-            # tax and profit are recomputed proportionally (simple approach)
-            # compute proportion factor
+            order_subtotal = money(order_subtotal - order_discount_amount)
+            # tax and profit are recomputed proportionally (simple approach);
             # if subtotal before was 0, skip
-            # Apply proportional reduction:
             if subtotal > 0:
                 factor = (subtotal - order_discount_amount) / subtotal
-                tax_total = money(tax_total * factor)
-                profit_total = money(profit_total * factor)
-        order.tax_total = money(tax_total)
-        order.grand_total = money(order.subtotal + order.tax_total)
-        order.profit_amount = money(profit_total)
+                tax_total = tax_total * factor
+                profit_total = profit_total * factor
+        order_tax = money(tax_total)
+
+        orders_t = Order.__table__
+        order_id = s.execute(orders_t.insert().values(
+            customer_id=cust_id, staff_id=session["user_id"], order_discount=order_discount_val,
+            subtotal=order_subtotal, tax_total=order_tax, grand_total=money(order_subtotal + order_tax),
+            profit_amount=money(profit_total),
+        ).returning(orders_t.c.id)).scalar_one()
+        s.execute(OrderItem.__table__.insert(), [
+            {"order_id": order_id, "product_id": prod.id, "quantity": qty,
+             "unit_price": prod.price, "gst_rate": prod.gst_rate, "discount_pct": disc}
+            for prod, qty, disc in lines
+        ])
+        # inventory log: one row per cart line, one executemany
+        s.execute(InventoryLog.__table__.insert(), [
+            {"product_id": prod.id, "change_qty": -qty, "reason": "sale",
+             "staff_id": session["user_id"], "note": f"Order #{order_id}"}
+            for prod, qty, _ in lines
+        ])
         s.commit()
+        invalidate_product_caches(stock_only=True)
         session["cart"] = []
         session.pop("order_discount", None)
-        flash(f"Order #{order.id} created", "success")
-        return redirect(url_for("invoice", order_id=order.id))
+        flash(f"Order #{order_id} created", "success")
+        return redirect(url_for("invoice", order_id=order_id))
 
-    # build cart view
-    cart_view = []
-    for line in cart:
-        p = s.get(Product, int(line["product_id"]))
-        if p:
-            cart_view.append({"product": p, "qty": int(line["qty"]), "discount": Decimal(str(line.get("discount",0)))})
-    return render_template("pos.html", products=products, cart=cart_view, order_discount=order_discount)
+    cart_view = cart_view_lines(s, cart)
+    cart_total = f"{from_paise(sum(line['total_paise'] for line in cart_view)):.2f}"
+    # the dropdown is only a shortcut; the search box reaches the rest of the catalogue
+    products = dropdown_products(s)
+    return render_template("pos.html", products=products, cart=cart_view, cart_total=cart_total,
+                           order_discount=order_discount, dropdown_limit=POS_DROPDOWN_LIMIT)
 
 # ---------------------------------------------------------------------
 # Orders, invoice, receipt, reports
 # ---------------------------------------------------------------------
+ORDERS_PAGE_SIZE = 50
+
 @app.route("/orders")
 def orders():
     r = require_login("staff")
     if r: return r
     s = db()
-    orders = s.query(Order).order_by(Order.created_at.desc()).limit(200).all()
-    return render_template("orders.html", orders=orders)
+    # customer/staff are shown on every row; load them with the orders in one SELECT
+    q = (s.query(Order)
+         .options(joinedload(Order.customer), joinedload(Order.staff))
+         .order_by(Order.created_at.desc(), Order.id.desc()))
+    # keyset pagination: continue strictly after the last (created_at, id) shown,
+    # so deep pages cost the same as the first one
+    before = request.args.get("before")
+    if before:
+        try:
+            cursor = datetime.fromisoformat(before)
+        except ValueError:
+            abort(400, description="Invalid cursor")
+        before_id = request.args.get("before_id", type=int)
+        if before_id is None:
+            q = q.filter(Order.created_at < cursor)
+        else:
+            q = q.filter(or_(Order.created_at < cursor,
+                             and_(Order.created_at == cursor, Order.id < before_id)))
+    orders = q.limit(ORDERS_PAGE_SIZE + 1).all()
+    next_page = None
+    if len(orders) > ORDERS_PAGE_SIZE:
+        orders = orders[:ORDERS_PAGE_SIZE]
+        last = orders[-1]
+        next_page = url_for("orders", before=last.created_at.isoformat(), before_id=last.id)
+    return render_template("orders.html", orders=orders, next_page=next_page, paged=bool(before))
+
+class InvoiceRow(NamedTuple):
+    name: str
+    qty: int
+    unit_price: str
+    discount: str
+    taxable: str
+    half_tax: str  # CGST and SGST each take half of the line's GST
+    total: str
+
+def invoice_rows(o: Order) -> list[InvoiceRow]:
+    # format every line once in Python so the templates only print strings
+    rows = []
+    for it in o.items:
+        t = it.totals
+        rows.append(InvoiceRow(it.product.name, it.quantity, "%.2f" % it.unit_price, "%.2f" % it.discount_pct,
+                               "%.2f" % t.taxable, "%.2f" % (t.tax / DEC_TWO), "%.2f" % t.total))
+    return rows
+
+def load_order_for_print(order_id: int) -> Order:
+    # everything invoice.html/receipt.html touch, in two SELECTs whatever the line count
+    o = (db().query(Order)
+         .options(selectinload(Order.items).joinedload(OrderItem.product), joinedload(Order.customer))
+         .filter(Order.id == order_id).one_or_none())
+    if not o: abort(404)
+    return o
 
 @app.route("/invoice/<int:order_id>")
 def invoice(order_id: int):
     r = require_login("staff")
     if r: return r
-    s = db()
-    o = s.get(Order, order_id)
-    if not o: abort(404)
-    # make item helper methods available in template via attribute access
-    return render_template("invoice.html", o=o)
+    o = load_order_for_print(order_id)
+    return render_template("invoice.html", o=o, rows=invoice_rows(o))
 
 @app.route("/receipt/<int:order_id>")
 def receipt(order_id: int):
     r = require_login("staff")
     if r: return r
-    s = db()
-    o = s.get(Order, order_id)
-    if not o: abort(404)
-    return render_template("receipt.html", o=o)
+    o = load_order_for_print(order_id)
+    return render_template("receipt.html", o=o, rows=invoice_rows(o))
 
 @app.route("/reports/daily")
 def reports_daily():
@@ -893,18 +1327,25 @@ def reports_daily():
     req = request.args.get("date")
     d = datetime.strptime(req,"%Y-%m-%d").date() if req else today()
     s = db()
-    start = datetime.combine(d, time.min)
-    end = datetime.combine(d, time.max)
+    start, end = day_bounds(d)
     sales, tax, profit = s.query(
         func.coalesce(func.sum(Order.subtotal),0),
         func.coalesce(func.sum(Order.tax_total),0),
         func.coalesce(func.sum(Order.profit_amount),0)
-    ).filter(Order.created_at.between(start,end)).first()
+    ).filter(Order.created_at >= start, Order.created_at < end).first()
     month_val = f"{d.year}-{d.month:02d}"
     return render_template("reports.html", req_date=d.strftime("%Y-%m-%d"),
                            sales=f"{(sales or 0):.2f}", tax=f"{(tax or 0):.2f}",
                            profit=f"{(profit or 0):.2f}", month=month_val)
 
+class MonthDayRow(NamedTuple):
+    day: str  # YYYY-MM-DD
+    orders: int
+    sub: str
+    tax: str
+    total: str
+    profit: str
+
 @app.route("/reports/monthly")
 def reports_monthly():
     r = require_login("staff")
@@ -915,32 +1356,25 @@ def reports_monthly():
     else:
         now = datetime.now(); y,m = now.year, now.month
     s = db()
-    start = datetime(y,m,1)
-    end = datetime(y + (m==12), (m%12)+1, 1) - timedelta(seconds=1)
-    sub, tax, total, profit = s.query(
-        func.coalesce(func.sum(Order.subtotal),0),
-        func.coalesce(func.sum(Order.tax_total),0),
-        func.coalesce(func.sum(Order.grand_total),0),
-        func.coalesce(func.sum(Order.profit_amount),0)
-    ).filter(Order.created_at.between(start,end)).first()
-    html = TEMPLATES["base.html"].replace("{% block content %}{% endblock %}", f"""
-    {{% block content %}}
-    <h2>Monthly Report: {y}-{m:02d}</h2>
-    <table>
-      <tr><th>Subtotal</th><td>₹ { (sub or 0):.2f }</td></tr>
-      <tr><th>Tax</th><td>₹ { (tax or 0):.2f }</td></tr>
-      <tr><th>Grand Total</th><td>₹ { (total or 0):.2f }</td></tr>
-      <tr><th>Profit</th><td>₹ { (profit or 0):.2f }</td></tr>
-    </table>
-    <p class="no-print"><a href="{{{{ url_for('reports_daily') }}}}">Back</a></p>
-    {{% endblock %}}
-    """)
-    return html
+    start, end = month_bounds(y, m)
+    # one GROUP BY day over the month's index range gives both the per-day rows and,
+    # summed here, the month totals (SQLite has no GROUPING SETS/ROLLUP)
+    day = func.date(Order.created_at)
+    rows = s.execute(
+        select(day, func.count(Order.id), func.sum(Order.subtotal), func.sum(Order.tax_total),
+               func.sum(Order.grand_total), func.sum(Order.profit_amount))
+        .where(Order.created_at >= start, Order.created_at < end)
+        .group_by(day).order_by(day)
+    ).all()
+    sums = [sum(col, DEC_ZERO) for col in zip(*(r[2:] for r in rows))] or [DEC_ZERO] * 4
+    days = [MonthDayRow(d, n, *(f"{v:.2f}" for v in vals)) for d, n, *vals in rows]
+    sub, tax, total, profit = sums
+    return render_template("reports_monthly.html", month=f"{y}-{m:02d}", days=days,
+                           sub=f"{sub:.2f}", tax=f"{tax:.2f}", total=f"{total:.2f}", profit=f"{profit:.2f}")
 
 # ---------------------------------------------------------------------
 # Helpers and app start
 # ---------------------------------------------------------------------
 if __name__ == "__main__":
     init_db()
-    app.jinja_env.globals["csrf_token"] = get_csrf_token
     app.run(debug=True)